@@ -1,7 +1,22 @@
 from fastapi import FastAPI, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from typing import Iterator, List, Literal
+import functools
 import importlib.metadata
+import os
+import re
+import secrets
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import asynccontextmanager
+
+import orjson
+import redis
+import requests
+from requests.adapters import HTTPAdapter
 
 # youtube-transcript-api 1.2.x: 인스턴스 + fetch()/list() 사용
 from youtube_transcript_api import (
@@ -11,7 +26,26 @@ from youtube_transcript_api import (
     VideoUnavailable,
 )
 
-app = FastAPI(title="YouTube Captions Proxy")
+# YouTube 요청용 공유 세션: 요청마다 TCP+TLS 핸드셰이크를 하지 않도록 keep-alive 커넥션 재사용
+HTTP_TIMEOUT = 10.0        # YouTube 요청 1회당 (라이브러리가 timeout 을 넘기지 않으므로 기본값 지정)
+
+class _TimeoutAdapter(HTTPAdapter):
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = HTTP_TIMEOUT
+        return super().send(request, **kwargs)
+
+_http = requests.Session()
+_http.mount("https://", _TimeoutAdapter(pool_connections=8, pool_maxsize=64))
+_http.mount("http://", _TimeoutAdapter())
+_yta = YouTubeTranscriptApi(http_client=_http)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    _http.close()
+
+app = FastAPI(title="YouTube Captions Proxy", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,38 +55,64 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 자막 JSON/SRT 는 압축률이 높음 → 작은 응답(헬스체크 등)은 그대로 두고 1KB 이상만 gzip
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 @app.get("/")
 def root():
     return {"ok": True}
 
 # ---------- 유틸 ----------
+# YouTube 차단/레이트리밋 판별용 토큰
+_BLOCK_RE = re.compile(r"429|403|too many requests|forbidden", re.IGNORECASE)
+
+# SRT 스트리밍 시 한 청크에 담을 큐 수 (청크마다 스레드풀 왕복이 생기므로 너무 잘게 나누지 않음)
+_SRT_CHUNK = 256
+
+@functools.lru_cache(maxsize=8192)
+def _hms(sec: int) -> str:
+    h, rem = divmod(sec, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h:02}:{m:02}:{s:02}"
+
 def _format_ts(sec: float) -> str:
-    h = int(sec // 3600)
-    m = int((sec % 3600) // 60)
-    s = int(sec % 60)
-    ms = int(round((sec - int(sec)) * 1000))
-    return f"{h:02}:{m:02}:{s:02},{ms:03}"
-
-def to_srt(items: List[dict]) -> str:
-    lines = []
+    s, ms = divmod(int(round(sec * 1000)), 1000)
+    return f"{_hms(s)},{ms:03}"
+
+def iter_srt(items: List[dict]) -> Iterator[bytes]:
+    """SRT 를 _SRT_CHUNK 개 큐 단위로 인코딩해 순서대로 내보냄"""
+    fmt = _format_ts
+    cues = []
+    sep = ""
     for i, it in enumerate(items, start=1):
-        start = it.get("start", 0.0)
-        dur = it.get("duration", 0.0)
-        end = start + dur
-        text = (it.get("text", "") or "").replace("\n", " ").strip() or " "
-        lines.append(str(i))
-        lines.append(f"{_format_ts(start)} --> {_format_ts(end)}")
-        lines.append(text)
-        lines.append("")
-    return "\n".join(lines).strip() + "\n"
+        get = it.get
+        start = get("start", 0.0)
+        end = start + get("duration", 0.0)
+        text = (get("text", "") or "").replace("\n", " ").strip() or " "
+        cues.append(f"{i}\n{fmt(start)} --> {fmt(end)}\n{text}\n")
+        if len(cues) == _SRT_CHUNK:
+            yield (sep + "\n".join(cues)).encode()
+            cues.clear()
+            sep = "\n"
+    if cues or not sep:
+        yield (sep + "\n".join(cues) or "\n").encode()
+
+def to_srt_bytes(items: List[dict]) -> bytes:
+    # 청크 단위로 인코딩된 bytes 를 이어붙임 → 전체 SRT 를 str 로 만들었다가 다시 인코딩하지 않음
+    return b"".join(iter_srt(items))
+
+@functools.lru_cache(maxsize=512)
+def _parse_langs(lang: str) -> tuple[str, ...]:
+    return tuple(x for x in (t.strip() for t in lang.split(",")) if x)
 
 def check_scraping_block(exc: Exception) -> bool:
-    msg = str(exc).lower()
-    if "429" in msg or "too many requests" in msg:
-        return True
-    if "403" in msg or "forbidden" in msg:
-        return True
-    return False
+    # requests.HTTPError (또는 이를 처리하던 중 발생한 라이브러리 예외) 는 상태 코드로 바로 판별.
+    # youtube-transcript-api 는 `raise ... from` 없이 감싸므로 원래 예외는 __context__ 에 있음
+    for e in (exc, exc.__cause__ or exc.__context__):
+        code = getattr(getattr(e, "response", None), "status_code", None)
+        if code in (403, 429):
+            return True
+    return _BLOCK_RE.search(str(exc)) is not None
 
 def _detail(user_msg: str, exc: Exception | None, debug: bool, scrapingBlocked: bool) -> str:
     base = user_msg
@@ -62,35 +122,154 @@ def _detail(user_msg: str, exc: Exception | None, debug: bool, scrapingBlocked:
         base += f" | {type(exc).__name__}: {exc!s}"
     return base
 
-# ---------- API ----------
-@app.get("/v1/transcript")
-def api_transcript(
-    videoId: str = Query(..., description="YouTube video id"),
-    lang: str = Query("en", description="BCP-47 코드, 여러 개는 콤마로(예: en,ko)"),
-    format: str = Query("json", pattern="^(json|srt)$"),
-    prefer: str = Query("any", pattern="^(any|manual|generated)$",
-                        description="any | manual(업로더 자막) | generated(자동 자막)"),
-    allowTranslate: bool = Query(True, description="요청 언어가 없으면 번역 폴백 허용"),
-    debug: bool = Query(False, description="에러 발생 시 상세 메시지 노출"),
-):
-    langs = [x.strip() for x in lang.split(",") if x.strip()]
-    scrapingBlocked = False
+# ---------- 캐시 ----------
+# REDIS_URL 이 설정된 경우에만 활성화 (예: redis://localhost:6379/0)
+REDIS_URL = os.getenv("REDIS_URL")
+CACHE_TTL = 24 * 3600      # 성공 응답
+NEG_CACHE_TTL = 60         # 404 / 429 응답
+LOCK_TTL = 5               # 동시 미스 시 업스트림 호출을 하나로 제한
+
+REDIS_TIMEOUT = 0.5        # Redis 가 응답하지 않을 때 캐시 미스로 보고 넘어가기까지의 시간(초)
+
+_redis = redis.Redis.from_url(
+    REDIS_URL, socket_timeout=REDIS_TIMEOUT, socket_connect_timeout=REDIS_TIMEOUT,
+) if REDIS_URL else None
+
+_UNLOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+def _cache_key(videoId: str, langs: tuple[str, ...], prefer: str, allowTranslate: bool, debug: bool) -> str:
+    return f"yt:{videoId}:{','.join(langs)}:{prefer}:{int(allowTranslate)}:{int(debug)}"
 
-    api = YouTubeTranscriptApi()
+def _cache_get(key: str) -> dict | None:
+    try:
+        raw = _redis.get(key)
+    except redis.RedisError:
+        return None
+    return orjson.loads(raw) if raw is not None else None
+
+def _cache_set(key: str, entry: dict, ttl: int) -> None:
+    try:
+        _redis.set(key, orjson.dumps(entry), ex=ttl)
+    except redis.RedisError:
+        pass
+
+def _from_cache_entry(entry: dict) -> dict:
+    if "payload" in entry:
+        return entry["payload"]
+    raise HTTPException(status_code=entry["status"], detail=entry["detail"])
+
+def _cached(key: str, load) -> dict:
+    """Redis 캐시를 거쳐 load() 결과(JSON payload)를 반환. 404/429 도 짧게 캐시."""
+    if _redis is None:
+        return load()
+
+    entry = _cache_get(key)
+    if entry is not None:
+        return _from_cache_entry(entry)
+
+    lock_key = key + ":lock"
+    token = secrets.token_hex(16)
+    try:
+        locked = bool(_redis.set(lock_key, token, nx=True, ex=LOCK_TTL))
+        contended = not locked
+    except redis.RedisError:
+        # Redis 장애 → 락 없이 바로 조회 (기다려도 캐시가 채워질 수 없음)
+        locked = contended = False
+    if contended:
+        # 다른 요청이 가져오는 중 → 락 만료 전까지 캐시를 기다림
+        deadline = time.monotonic() + LOCK_TTL
+        while time.monotonic() < deadline:
+            time.sleep(0.1)
+            entry = _cache_get(key)
+            if entry is not None:
+                return _from_cache_entry(entry)
+
+    # 캐시 기록은 락을 풀기 전에 → 그 사이 다른 워커가 미스를 보고 다시 가져오지 않도록
+    try:
+        payload = load()
+        _cache_set(key, {"payload": payload}, CACHE_TTL)
+        return payload
+    except HTTPException as e:
+        if e.status_code in (404, 429):
+            _cache_set(key, {"status": e.status_code, "detail": e.detail}, NEG_CACHE_TTL)
+        raise
+    finally:
+        if locked:
+            try:
+                # LOCK_TTL 이 지나 다른 워커가 잡은 락은 지우지 않도록 토큰이 같을 때만 삭제
+                _redis.eval(_UNLOCK_SCRIPT, 1, lock_key, token)
+            except redis.RedisError:
+                pass
+
+# 같은 key 로 동시에 들어온 요청은 먼저 시작된 조회 하나의 결과를 함께 기다림 (워커 프로세스 단위)
+_inflight: dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+# 리더 조회 1회의 최악 업스트림 호출 수 (youtube-transcript-api 1.2.2, 프록시 재시도 없음):
+#   fetch(): 워치 페이지 + 동의 쿠키 후 재요청 + innertube = 3 → NoTranscriptFound
+#   list():  같은 3회 + transcript.fetch() 의 timedtext 1회 = 4
+MAX_UPSTREAM_CALLS = 7
+# 대기 요청의 상한: 호출마다 connect/read 타임아웃을 한 번씩 다 쓰는 경우 + 캐시 락 대기.
+# HTTP_TIMEOUT 은 소켓 단위라 바이트를 조금씩 흘리는 응답은 이보다 오래 걸릴 수 있고,
+# 그때는 리더가 아직 진행 중이어도 대기 요청은 504 를 받음.
+SINGLE_FLIGHT_TIMEOUT = MAX_UPSTREAM_CALLS * 2 * HTTP_TIMEOUT + LOCK_TTL
+
+def _single_flight(key: str, load) -> dict:
+    with _inflight_lock:
+        fut = _inflight.get(key)
+        leader = fut is None
+        if leader:
+            fut = _inflight[key] = Future()
+    if not leader:
+        try:
+            return fut.result(timeout=SINGLE_FLIGHT_TIMEOUT)
+        except FutureTimeout:
+            raise HTTPException(status_code=504, detail="Timed out waiting for an in-flight transcript request.")
+
+    try:
+        payload = load()
+    except BaseException as e:
+        fut.set_exception(e)
+        raise
+    else:
+        fut.set_result(payload)
+        return payload
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+
+# ---------- 조회 ----------
+def _pick_transcript(tl, prefer: str, langs: tuple[str, ...]):
+    """prefer 우선순위(manual/generated)에 맞는 자막을 TranscriptList 에서 선택"""
+    if prefer in ("manual", "any"):
+        try:
+            return tl.find_manually_created_transcript(langs)
+        except Exception:
+            pass
+    if prefer in ("generated", "any"):
+        try:
+            return tl.find_generated_transcript(langs)
+        except Exception:
+            pass
+    return None
+
+def _load_transcript(videoId: str, langs: tuple[str, ...], prefer: str, allowTranslate: bool, debug: bool) -> dict:
+    scrapingBlocked = False
 
     # 1) 요청 언어로 직접 시도
     try:
-        fetched = api.fetch(videoId, languages=langs)  # FetchedTranscript
-        items = fetched.to_raw_data()                  # List[dict]
-        if format == "json":
-            return {"videoId": videoId, "lang": fetched.language_code, "items": items, "scrapingBlocked": scrapingBlocked}
-        else:
-            return Response(content=to_srt(items), media_type="text/plain; charset=utf-8")
+        fetched = _yta.fetch(videoId, languages=langs)  # FetchedTranscript
+        items = fetched.to_raw_data()                   # List[dict]
+        return {"videoId": videoId, "lang": fetched.language_code, "items": items, "scrapingBlocked": scrapingBlocked}
 
     except NoTranscriptFound:
         # 2) 목록 조회 → 수동/자동 우선순위 반영
         try:
-            tl = api.list(videoId)  # TranscriptList
+            tl = _yta.list(videoId)  # TranscriptList
         except (TranscriptsDisabled, VideoUnavailable) as e:
             scrapingBlocked = check_scraping_block(e)
             raise HTTPException(status_code=404, detail=_detail("Transcript unavailable.", e, debug, scrapingBlocked))
@@ -98,29 +277,16 @@ def api_transcript(
             scrapingBlocked = check_scraping_block(e)
             raise HTTPException(status_code=500, detail=_detail("Internal error while listing transcripts.", e, debug, scrapingBlocked))
 
-        transcript = None
-
-        def pick_transcript():
-            if prefer in ("manual", "any"):
-                try:
-                    return tl.find_manually_created_transcript(langs)
-                except Exception:
-                    pass
-            if prefer in ("generated", "any"):
-                try:
-                    return tl.find_generated_transcript(langs)
-                except Exception:
-                    pass
-            return None
-
-        transcript = pick_transcript()
+        transcript = _pick_transcript(tl, prefer, langs)
 
         # 3) 번역 폴백
         if not transcript and allowTranslate:
             try:
-                manual = [t for t in tl if not t.is_generated]
-                base = manual[0] if manual else list(tl)[0]
-                transcript = base.translate(langs[0])
+                base = next((t for t in tl if not t.is_generated), None)
+                if base is None:
+                    base = next(iter(tl), None)
+                if base is not None:
+                    transcript = base.translate(langs[0])
             except Exception:
                 pass
 
@@ -128,17 +294,14 @@ def api_transcript(
             raise HTTPException(status_code=404, detail=_detail("No transcript in requested languages.", None, debug, scrapingBlocked))
 
         items = transcript.fetch().to_raw_data()
-        if format == "json":
-            return {
-                "videoId": videoId,
-                "lang": transcript.language_code,
-                "isTranslated": transcript.language_code != langs[0],
-                "isGenerated": getattr(transcript, "is_generated", False),
-                "items": items,
-                "scrapingBlocked": scrapingBlocked,
-            }
-        else:
-            return Response(content=to_srt(items), media_type="text/plain; charset=utf-8")
+        return {
+            "videoId": videoId,
+            "lang": transcript.language_code,
+            "isTranslated": transcript.language_code != langs[0],
+            "isGenerated": getattr(transcript, "is_generated", False),
+            "items": items,
+            "scrapingBlocked": scrapingBlocked,
+        }
 
     except Exception as e:
         scrapingBlocked = check_scraping_block(e)
@@ -146,25 +309,61 @@ def api_transcript(
             raise HTTPException(status_code=429, detail=_detail("Rate limited or blocked by YouTube.", e, debug, scrapingBlocked))
         raise HTTPException(status_code=500, detail=_detail("Internal server error.", e, debug, scrapingBlocked))
 
+# ---------- API ----------
+@app.get("/v1/transcript")
+def api_transcript(
+    videoId: str = Query(..., description="YouTube video id"),
+    lang: str = Query("en", description="BCP-47 코드, 여러 개는 콤마로(예: en,ko)"),
+    format: Literal["json", "srt"] = Query("json"),
+    prefer: Literal["any", "manual", "generated"] = Query("any",
+                                                          description="any | manual(업로더 자막) | generated(자동 자막)"),
+    allowTranslate: bool = Query(True, description="요청 언어가 없으면 번역 폴백 허용"),
+    debug: bool = Query(False, description="에러 발생 시 상세 메시지 노출"),
+):
+    langs = _parse_langs(lang)
+
+    # JSON payload 를 캐시하고 SRT 는 응답 시점에 변환 → 두 포맷이 같은 캐시 항목을 공유
+    key = _cache_key(videoId, langs, prefer, allowTranslate, debug)
+    load = functools.partial(_load_transcript, videoId, langs, prefer, allowTranslate, debug)
+    payload = _single_flight(key, lambda: _cached(key, load))
+
+    if format == "json":
+        return ORJSONResponse(content=payload)  # jsonable_encoder 를 거치지 않고 바로 직렬화
+    else:
+        items = payload["items"]
+        if len(items) <= _SRT_CHUNK:
+            # 한 청크로 끝나는 크기면 스트리밍 없이 Content-Length 를 가진 단일 응답으로
+            return Response(content=to_srt_bytes(items), media_type="text/plain; charset=utf-8")
+        return StreamingResponse(iter_srt(items), media_type="text/plain; charset=utf-8")
+
+# 헬스체크가 샘플 영상을 반복 호출해 429 를 유발하지 않도록 짧게 캐시
+DIAG_TTL = 30.0
+_diag_cache: tuple[float, dict] | None = None
+
 @app.get("/v1/diag")
 def api_diag():
-    """설치 버전 및 샘플 호출 결과 확인"""
+    """설치 버전 및 샘플 호출 결과 확인 (DIAG_TTL 초 동안 캐시)"""
+    global _diag_cache
+    if _diag_cache is not None and time.monotonic() - _diag_cache[0] < DIAG_TTL:
+        return _diag_cache[1]
+
     try:
         ver = importlib.metadata.version("youtube-transcript-api")
     except Exception:
         ver = "UNKNOWN"
 
-    api = YouTubeTranscriptApi()
     test_id = "5MgBikgcWnY"  # 자막 있는 영상 예시
     try:
-        fetched = api.fetch(test_id, languages=["en"])
+        fetched = _yta.fetch(test_id, languages=["en"])
         items = fetched.to_raw_data()
-        return {"ok": True, "yta_version": ver, "sample_items": len(items)}
+        result = {"ok": True, "yta_version": ver, "sample_items": len(items)}
     except Exception as e:
         blocked = check_scraping_block(e)
-        return {
+        result = {
             "ok": False,
             "yta_version": ver,
             "error": f"{type(e).__name__}: {e}",
             "scrapingBlocked": blocked,
         }
+    _diag_cache = (time.monotonic(), result)
+    return result
@@ -0,0 +1,186 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+from youtube_transcript_api import YouTubeRequestFailed
+
+import app.main as main
+
+
+class _NoRegex:
+    def search(self, _msg):
+        raise AssertionError("regex fallback should not run")
+
+
+def _request_failed(status_code: int) -> YouTubeRequestFailed:
+    response = requests.Response()
+    response.status_code = status_code
+    response.url = "https://www.youtube.com/api/timedtext"
+    # youtube-transcript-api 와 같은 방식으로 감쌈: `except HTTPError` 안에서 `from` 없이 raise
+    try:
+        try:
+            response.raise_for_status()
+        except requests.HTTPError as error:
+            raise YouTubeRequestFailed("abc123", error)
+    except YouTubeRequestFailed as e:
+        return e
+    raise AssertionError("expected YouTubeRequestFailed")
+
+
+def test_check_scraping_block_uses_status_code_of_wrapped_http_error(monkeypatch):
+    exc = _request_failed(403)
+    assert exc.__cause__ is None
+    assert isinstance(exc.__context__, requests.HTTPError)
+
+    monkeypatch.setattr(main, "_BLOCK_RE", _NoRegex())
+    assert main.check_scraping_block(exc) is True
+
+
+def test_check_scraping_block_falls_back_to_message():
+    assert main.check_scraping_block(Exception("HTTP Error 429: Too Many Requests")) is True
+    assert main.check_scraping_block(Exception("video not found")) is False
+
+
+def _reference_srt(items) -> str:
+    # 스트리밍 도입 전 to_srt 와 같은 출력
+    cues = []
+    for i, it in enumerate(items, start=1):
+        start = it.get("start", 0.0)
+        end = start + it.get("duration", 0.0)
+        text = (it.get("text", "") or "").replace("\n", " ").strip() or " "
+        cues.append(f"{i}\n{main._format_ts(start)} --> {main._format_ts(end)}\n{text}\n")
+    return "\n".join(cues) or "\n"
+
+
+def _items(n: int) -> list[dict]:
+    return [
+        {"text": "" if i % 7 == 0 else f"line {i}\nnext 한글", "start": i * 1.234, "duration": 2.5}
+        for i in range(n)
+    ]
+
+
+@pytest.mark.parametrize("n", [0, 1, 255, 256, 257, 512, 513])
+def test_to_srt_bytes_matches_unbatched_output_at_chunk_boundaries(n):
+    items = _items(n)
+    assert main.to_srt_bytes(items) == _reference_srt(items).encode()
+    assert len(list(main.iter_srt(items))) == max(1, -(-n // main._SRT_CHUNK))
+
+
+
+class _StubRedis:
+    """_cached 가 쓰는 get / set(nx, ex) / eval(언락 스크립트) 만 흉내내고 호출 순서를 기록"""
+
+    def __init__(self):
+        self.data = {}
+        self.ops = []
+
+    def get(self, key):
+        self.ops.append(("get", key))
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        self.ops.append(("set", key))
+        if nx and key in self.data:
+            return None
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+        return True
+
+    def eval(self, script, numkeys, key, token):
+        self.ops.append(("unlock", key))
+        if self.data.get(key) == token.encode():
+            del self.data[key]
+            return 1
+        return 0
+
+
+@pytest.fixture
+def stub_redis(monkeypatch):
+    stub = _StubRedis()
+    monkeypatch.setattr(main, "_redis", stub)
+    return stub
+
+
+def test_cached_writes_payload_before_releasing_lock(stub_redis):
+    assert main._cached("k", lambda: {"items": [1]}) == {"items": [1]}
+
+    writes = [op for op in stub_redis.ops if op[0] != "get"]
+    assert writes == [("set", "k:lock"), ("set", "k"), ("unlock", "k:lock")]
+    assert "k:lock" not in stub_redis.data
+
+
+def test_cached_hit_skips_load(stub_redis):
+    main._cached("k", lambda: {"items": [1]})
+
+    def load():
+        raise AssertionError("load should not run on a cache hit")
+
+    assert main._cached("k", load) == {"items": [1]}
+
+
+@pytest.mark.parametrize("status, cached", [(404, True), (429, True), (500, False)])
+def test_cached_negative_results(stub_redis, status, cached):
+    calls = []
+
+    def load():
+        calls.append(1)
+        raise main.HTTPException(status_code=status, detail="nope")
+
+    for _ in range(2):
+        with pytest.raises(main.HTTPException) as e:
+            main._cached("k", load)
+        assert e.value.status_code == status and e.value.detail == "nope"
+    assert len(calls) == (1 if cached else 2)
+
+
+def test_cached_keeps_lock_taken_over_by_another_worker(stub_redis):
+    def load():
+        # LOCK_TTL 이 지나 다른 워커가 같은 락을 잡은 상황
+        stub_redis.data["k:lock"] = b"other-token"
+        return {"items": []}
+
+    main._cached("k", load)
+    assert stub_redis.data["k:lock"] == b"other-token"
+
+
+def _run_concurrently(n: int, key: str, load):
+    barrier = threading.Barrier(n)
+
+    def call():
+        barrier.wait()
+        return main._single_flight(key, load)
+
+    with ThreadPoolExecutor(n) as pool:
+        futures = [pool.submit(call) for _ in range(n)]
+    return futures
+
+
+def test_single_flight_runs_load_once_for_concurrent_callers():
+    calls = []
+
+    def load():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"items": [1]}
+
+    futures = _run_concurrently(8, "k", load)
+    assert [f.result() for f in futures] == [{"items": [1]}] * 8
+    assert len(calls) == 1
+    assert main._inflight == {}
+
+
+def test_single_flight_propagates_errors_to_every_waiter():
+    calls = []
+
+    def load():
+        calls.append(1)
+        time.sleep(0.2)
+        raise main.HTTPException(status_code=404, detail="nope")
+
+    futures = _run_concurrently(8, "k", load)
+    for f in futures:
+        assert isinstance(f.exception(), main.HTTPException)
+        assert f.exception().status_code == 404
+    assert len(calls) == 1
+    assert main._inflight == {}